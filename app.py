@@ -1,8 +1,17 @@
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import MappingProxyType
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import requests
 import streamlit as st
 import plotly.express as px
 from nba_api.stats.endpoints import LeagueDashTeamStats
+from nba_api.stats.library.http import NBAStatsHTTP
 
 # ===================== PAGE CONFIG =====================
 st.set_page_config(
@@ -99,7 +108,8 @@ SEASONS = [
     "2019-20", "2020-21", "2021-22", "2022-23", "2023-24"
 ]
 
-CHAMPIONS_DATA = {
+# Frozen: read on every rerun, never mutated.
+CHAMPIONS_DATA = MappingProxyType({
     "2014-15": "Golden State Warriors",
     "2015-16": "Cleveland Cavaliers",
     "2016-17": "Golden State Warriors",
@@ -110,56 +120,184 @@ CHAMPIONS_DATA = {
     "2021-22": "Golden State Warriors",
     "2022-23": "Denver Nuggets",
     "2023-24": "Boston Celtics"
-}
+})
 
 ACCENT = "#667eea"
 ACCENT_2 = "#a78bfa"
 
-# ===================== DATA (cached, no disk writes) =====================
+KEEP_COLS = ("TEAM_NAME", "GP", "W", "L", "FG3M", "FG3A", "FG3_PCT", "PTS")
+
+DISPLAY_COLS = (
+    "TEAM_NAME", "W", "L",
+    "THREES_PER_GAME", "THREES_ATT_PER_GAME",
+    "FG3_PCT", "IS_CHAMPION",
+)
+
+DISPLAY_RENAMES = MappingProxyType({
+    "TEAM_NAME": "Time",
+    "W": "Vitórias",
+    "L": "Derrotas",
+    "THREES_PER_GAME": "3PT/Jogo",
+    "THREES_ATT_PER_GAME": "Tentativas 3PT/Jogo",
+    "FG3_PCT": "3PT %",
+    "IS_CHAMPION": "Campeão",
+})
+
+# Seasons before the current one are immutable, so their Parquet files never expire.
+CACHE_DIR = Path("data/cache")
+CURRENT_SEASON = SEASONS[-1]
+
+# At most 4 in-flight requests against stats.nba.com at any time.
+_FETCH_LIMIT = threading.Semaphore(4)
+
+# One pooled keep-alive session for all stats.nba.com calls, so concurrent
+# fetches reuse TLS connections instead of paying a handshake each. The
+# headers kwarg on nba_api endpoints *replaces* its defaults, so extend the
+# library's browser-style header set rather than passing a minimal one.
+_SESSION = requests.Session()
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4))
+NBAStatsHTTP.set_session(_SESSION)
+
+_STATS_HEADERS = {
+    **NBAStatsHTTP.headers,
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
+# ===================== DATA (two-tier cache: memory + parquet) =====================
 @st.cache_data(ttl=60 * 60 * 24 * 7, show_spinner=False)
 def fetch_team_stats_for_season(season: str) -> pd.DataFrame:
-    stats = LeagueDashTeamStats(season=season, per_mode_detailed="PerGame")
-    df = stats.get_data_frames()[0].copy()
+    cache_path = CACHE_DIR / f"{season}.parquet"
+    if cache_path.exists():
+        return pd.read_parquet(cache_path, columns=[*KEEP_COLS, "SEASON"])
+
+    with _FETCH_LIMIT:
+        stats = LeagueDashTeamStats(
+            season=season,
+            per_mode_detailed="PerGame",
+            headers=_STATS_HEADERS,
+            timeout=30,
+        )
+    df = stats.get_data_frames()[0][list(KEEP_COLS)]
     df["SEASON"] = season
+
+    if season != CURRENT_SEASON:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(cache_path, compression="zstd")
+
     return df
 
-@st.cache_data(ttl=60 * 60 * 24 * 7, show_spinner="Buscando dados da NBA (pode demorar na 1ª vez)...")
-def load_dataset() -> pd.DataFrame:
-    frames = []
-    for s in SEASONS:
-        df_s = fetch_team_stats_for_season(s)
-        frames.append(df_s)
-        time.sleep(0.35)  # gentle pacing
+# cache_resource shares one copy across all sessions (cache_data would
+# duplicate the frames per caller); Arrow tables are the immutable store
+# and pandas views are rebuilt cheaply where consumers need them.
+@st.cache_resource(ttl=60 * 60 * 24 * 7, show_spinner="Buscando dados da NBA (pode demorar na 1ª vez)...")
+def _load_dataset_tables() -> tuple[pa.Table, pa.Table, float]:
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        frames = list(executor.map(fetch_team_stats_for_season, SEASONS))
 
     df = pd.concat(frames, ignore_index=True)
 
-    keep = ["SEASON", "TEAM_NAME", "GP", "W", "L", "FG3M", "FG3A", "FG3_PCT", "PTS"]
-    df = df[keep].copy()
-
     # Normalize FG3_PCT to 0-100 if needed
     if df["FG3_PCT"].max() <= 1:
         df["FG3_PCT"] = df["FG3_PCT"] * 100
 
-    # Derived metrics
-    df["THREES_PER_GAME"] = df["FG3M"]
-    df["THREES_ATT_PER_GAME"] = df["FG3A"]
-    df["POINTS_FROM_3"] = df["FG3M"] * 3
-    df["PERCENT_POINTS_3"] = (df["POINTS_FROM_3"] / df["PTS"]) * 100
+    # Derived metrics. FG3M/FG3A are already per-game, so renaming beats
+    # storing identical copies under two names. PERCENT_POINTS_3 is derived
+    # on the small render slices instead of being materialized here.
+    df.rename(
+        columns={"FG3M": "THREES_PER_GAME", "FG3A": "THREES_ATT_PER_GAME"},
+        inplace=True,
+    )
 
-    champs_df = pd.DataFrame(list(CHAMPIONS_DATA.items()), columns=["SEASON", "CHAMPION_TEAM"])
-    df = df.merge(champs_df, on="SEASON", how="left")
-    df["IS_CHAMPION"] = df["TEAM_NAME"] == df["CHAMPION_TEAM"]
+    # A 10-entry lookup doesn't need a merge; map() skips the join machinery.
+    df["CHAMPION_TEAM"] = df["SEASON"].map(CHAMPIONS_DATA)
+    df["IS_CHAMPION"] = df["TEAM_NAME"].to_numpy() == df["CHAMPION_TEAM"].to_numpy()
+
+    # Shrink the cached frame: every value fits in int16/float32, and the
+    # name columns only hold 30 teams / 10 seasons, so categoricals cut
+    # them ~10x and speed up the SEASON groupby downstream.
+    for c in ("GP", "W", "L"):
+        df[c] = df[c].astype("int16")
+    for c in ("THREES_PER_GAME", "THREES_ATT_PER_GAME", "FG3_PCT", "PTS"):
+        df[c] = df[c].astype("float32")
+    for c in ("TEAM_NAME", "SEASON", "CHAMPION_TEAM"):
+        df[c] = df[c].astype("category")
+
+    # Pre-aggregate the tiny league-vs-champion series once here, so the
+    # history tab just plots it instead of re-running the groupby per rerun.
+    league = df.groupby("SEASON", as_index=False, observed=True)["THREES_ATT_PER_GAME"].mean()
+    league["Série"] = "Liga (média)"
+    champs = df.loc[df["IS_CHAMPION"], ["SEASON", "THREES_ATT_PER_GAME"]].copy()
+    champs["Série"] = "Campeão"
+    evolution_df = pd.concat([league, champs], ignore_index=True)
+
+    # The load timestamp doubles as a dataset-version token: downstream
+    # cache_data helpers key on it, so their entries die with this build
+    # instead of outliving the weekly refresh.
+    return (
+        pa.Table.from_pandas(df, preserve_index=False),
+        pa.Table.from_pandas(evolution_df, preserve_index=False),
+        time.time(),
+    )
 
-    return df
+def load_dataset() -> tuple[pd.DataFrame, pd.DataFrame]:
+    table, evolution_table, _ = _load_dataset_tables()
+    return table.to_pandas(), evolution_table.to_pandas()
+
+def _dataset_version() -> float:
+    return _load_dataset_tables()[2]
+
+@st.cache_data(show_spinner=False)
+def _teams_for(version: float, season: str) -> tuple[str, ...]:
+    df, _ = load_dataset()
+    return tuple(sorted(df.loc[df["SEASON"] == season, "TEAM_NAME"].unique()))
+
+@st.cache_data(show_spinner=False)
+def _filter_dataset(version: float, season: str, teams: tuple, min_pct: int) -> pd.DataFrame:
+    """Season/team/3PT% slice, memoized so reruns skip the mask + copy."""
+    df, _ = load_dataset()
+    mask = (df["SEASON"].to_numpy() == season) & (df["FG3_PCT"].to_numpy() >= min_pct)
+    if teams != _teams_for(version, season):  # the default "all teams" skips the isin scan
+        mask &= np.isin(df["TEAM_NAME"].to_numpy(), teams)
+    return df.loc[mask]
+
+def _display_frame(df_filtered: pd.DataFrame) -> pd.DataFrame:
+    df_display = df_filtered[list(DISPLAY_COLS)].rename(columns=DISPLAY_RENAMES)
+    # Derived for the ~30 rendered rows only, not stored in the cached dataset.
+    df_display.insert(
+        6,
+        "% Pontos do 3PT",
+        df_filtered["THREES_PER_GAME"].to_numpy() * 300.0 / df_filtered["PTS"].to_numpy(),
+    )
+    return df_display
+
+@st.cache_data(show_spinner=False)
+def _csv_bytes(version: float, season: str, teams: tuple, min_pct: int) -> bytes:
+    df_display = _display_frame(_filter_dataset(version, season, teams, min_pct))
+    return df_display.to_csv(index=False).encode("utf-8")
 
 # ===================== UI HELPERS =====================
-def render_metrics(df_filtered: pd.DataFrame):
+def _df_hash(df: pd.DataFrame):
+    """Cheap identity for cache keys; avoids pickling the whole frame.
+
+    Hashing only the categorical SEASON column keeps the scan tiny, and
+    hash_pandas_object folds in the row index, so two different row subsets
+    of one dataset build never collide. The dataset-version token covers
+    the remaining case: a refresh that changes stat values but leaves the
+    index/SEASON layout identical.
+    """
+    return (_dataset_version(), len(df), int(pd.util.hash_pandas_object(df["SEASON"]).sum()))
+
+def render_metrics(df_filtered: pd.DataFrame, season: str):
     c1, c2, c3, c4 = st.columns(4)
 
     avg_att = df_filtered["THREES_ATT_PER_GAME"].mean()
     avg_pct = df_filtered["FG3_PCT"].mean()
 
-    champ_row = df_filtered[df_filtered["IS_CHAMPION"]].head(1)
+    # The champion is known by name, so a direct equality compare beats
+    # scanning the IS_CHAMPION column.
+    champ_team = CHAMPIONS_DATA.get(season)
+    champ_row = df_filtered[df_filtered["TEAM_NAME"].to_numpy() == champ_team]
 
     with c1:
         st.metric("Tentativas 3PT/Jogo", f"{avg_att:.1f}", "Liga")
@@ -176,17 +314,23 @@ def render_metrics(df_filtered: pd.DataFrame):
 
     with c4:
         if not champ_row.empty:
-            p3 = float(champ_row.iloc[0]["PERCENT_POINTS_3"])
+            row = champ_row.iloc[0]
+            p3 = float(row["THREES_PER_GAME"]) * 300.0 / float(row["PTS"])
             st.metric("% pontos do 3PT", f"{p3:.1f}%", "Campeão")
         else:
             st.metric("% pontos do 3PT", "N/A")
 
-def plot_top_bar(df_filtered: pd.DataFrame):
-    top = (
-        df_filtered.nlargest(10, "THREES_PER_GAME")
-        .sort_values("THREES_PER_GAME")
-        .copy()
-    )
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _df_hash})
+def _build_top_bar_fig(df_filtered: pd.DataFrame):
+    # Top-K via argpartition: O(n) select plus a sort of just the 10 winners,
+    # instead of nlargest + sort_values over the whole filtered column.
+    vals = df_filtered["THREES_PER_GAME"].to_numpy()
+    k = min(10, vals.size)
+    if k:
+        idx = np.argpartition(-vals, k - 1)[:k]
+        top = df_filtered.iloc[idx[np.argsort(vals[idx])]]
+    else:
+        top = df_filtered
 
     fig = px.bar(
         top,
@@ -207,9 +351,13 @@ def plot_top_bar(df_filtered: pd.DataFrame):
         yaxis_title="",
         legend_title_text="Campeão",
     )
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
 
-def plot_scatter(df_filtered: pd.DataFrame):
+def plot_top_bar(df_filtered: pd.DataFrame):
+    st.plotly_chart(_build_top_bar_fig(df_filtered), use_container_width=True)
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _df_hash})
+def _build_scatter_fig(df_filtered: pd.DataFrame):
     fig = px.scatter(
         df_filtered,
         x="THREES_ATT_PER_GAME",
@@ -219,6 +367,7 @@ def plot_scatter(df_filtered: pd.DataFrame):
         hover_name="TEAM_NAME",
         color_discrete_map={True: ACCENT_2, False: ACCENT},
         title="Volume vs Eficiência — Tentativas 3PT/Jogo x 3PT%",
+        render_mode="webgl",
     )
     fig.update_layout(
         template="plotly_dark",
@@ -228,25 +377,22 @@ def plot_scatter(df_filtered: pd.DataFrame):
         yaxis_title="3PT (%)",
         legend_title_text="Campeão",
     )
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
 
-def plot_evolution(df_all: pd.DataFrame):
-    league = df_all.groupby("SEASON", as_index=False)["THREES_ATT_PER_GAME"].mean()
-    league["Série"] = "Liga (média)"
-
-    champs = df_all[df_all["IS_CHAMPION"]][["SEASON", "THREES_ATT_PER_GAME"]].copy()
-    champs["Série"] = "Campeão"
-
-    df_plot = pd.concat([league, champs], ignore_index=True)
+def plot_scatter(df_filtered: pd.DataFrame):
+    st.plotly_chart(_build_scatter_fig(df_filtered), use_container_width=True)
 
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _df_hash})
+def _build_evolution_fig(evolution_df: pd.DataFrame):
     fig = px.line(
-        df_plot,
+        evolution_df,
         x="SEASON",
         y="THREES_ATT_PER_GAME",
         color="Série",
         markers=True,
         title="Evolução — Tentativas de 3 por jogo (Liga vs Campeão)",
         color_discrete_map={"Liga (média)": ACCENT, "Campeão": ACCENT_2},
+        render_mode="webgl",
     )
     fig.update_layout(
         template="plotly_dark",
@@ -255,7 +401,10 @@ def plot_evolution(df_all: pd.DataFrame):
         xaxis_title="Temporada",
         yaxis_title="Tentativas de 3PT/Jogo",
     )
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
+
+def plot_evolution(evolution_df: pd.DataFrame):
+    st.plotly_chart(_build_evolution_fig(evolution_df), use_container_width=True)
 
 # ===================== APP =====================
 def main():
@@ -268,33 +417,42 @@ def main():
 
     if st.sidebar.button("🔄 Atualizar dados (limpar cache)"):
         st.cache_data.clear()
+        st.cache_resource.clear()
         st.rerun()
 
-    df = load_dataset()
+    df, evolution_df = load_dataset()
+    dataset_version = _dataset_version()
 
     with st.sidebar.form("filters"):
         selected_season = st.selectbox(
             "📅 Temporada",
-            options=sorted(df["SEASON"].unique(), reverse=True),
+            options=list(reversed(SEASONS)),
             index=0
         )
 
-        df_season = df[df["SEASON"] == selected_season].copy()
-        teams = sorted(df_season["TEAM_NAME"].unique())
+        teams = _teams_for(dataset_version, selected_season)
 
         selected_teams = st.multiselect("🏆 Times", options=teams, default=teams)
         min_fg3_pct = st.slider("🎯 3PT% mínimo", 0, 100, 0, 1)
 
         apply = st.form_submit_button("Aplicar")
 
-    df_filtered = df_season[df_season["TEAM_NAME"].isin(selected_teams)].copy()
-    df_filtered = df_filtered[df_filtered["FG3_PCT"] >= min_fg3_pct].copy()
-
-    tab1, tab2, tab3, tab4 = st.tabs(["Visão geral", "Histórico", "Tabela", "Sobre"])
+    filter_key = (dataset_version, selected_season, tuple(sorted(selected_teams)), min_fg3_pct)
+    df_filtered = _filter_dataset(*filter_key)
+
+    # st.tabs renders every tab body on every rerun; a radio-backed dispatch
+    # only executes the section the user is actually looking at.
+    selected_tab = st.radio(
+        "Seção",
+        ["Visão geral", "Histórico", "Tabela", "Sobre"],
+        horizontal=True,
+        label_visibility="collapsed",
+        key="tab",
+    )
 
-    with tab1:
+    if selected_tab == "Visão geral":
         st.markdown('<div class="section-header">📈 Métricas da temporada</div>', unsafe_allow_html=True)
-        render_metrics(df_filtered)
+        render_metrics(df_filtered, selected_season)
 
         st.markdown('<div class="section-header">🎯 Top 3PT/Jogo</div>', unsafe_allow_html=True)
         plot_top_bar(df_filtered)
@@ -302,32 +460,18 @@ def main():
         st.markdown('<div class="section-header">🧭 Volume x eficiência</div>', unsafe_allow_html=True)
         plot_scatter(df_filtered)
 
-    with tab2:
+    elif selected_tab == "Histórico":
         st.markdown('<div class="section-header">📊 Evolução histórica</div>', unsafe_allow_html=True)
-        plot_evolution(df)
+        plot_evolution(evolution_df)
 
-    with tab3:
+    elif selected_tab == "Tabela":
         st.markdown('<div class="section-header">📋 Dados detalhados</div>', unsafe_allow_html=True)
 
-        display_cols = [
-            "TEAM_NAME", "W", "L",
-            "THREES_PER_GAME", "THREES_ATT_PER_GAME",
-            "FG3_PCT", "PERCENT_POINTS_3", "IS_CHAMPION"
-        ]
-        df_display = df_filtered[display_cols].copy().rename(columns={
-            "TEAM_NAME": "Time",
-            "W": "Vitórias",
-            "L": "Derrotas",
-            "THREES_PER_GAME": "3PT/Jogo",
-            "THREES_ATT_PER_GAME": "Tentativas 3PT/Jogo",
-            "FG3_PCT": "3PT %",
-            "PERCENT_POINTS_3": "% Pontos do 3PT",
-            "IS_CHAMPION": "Campeão",
-        })
+        df_display = _display_frame(df_filtered)
 
         st.dataframe(df_display, use_container_width=True, height=460)
 
-        csv = df_display.to_csv(index=False).encode("utf-8")
+        csv = _csv_bytes(*filter_key)
         st.download_button(
             "⬇️ Baixar CSV da temporada",
             data=csv,
@@ -335,7 +479,7 @@ def main():
             mime="text/csv",
         )
 
-    with tab4:
+    else:
         st.markdown('<div class="section-header">ℹ️ Sobre</div>', unsafe_allow_html=True)
         st.write(
             "Este app usa nba_api (LeagueDashTeamStats) em modo PerGame e destaca o campeão por temporada. "